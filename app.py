@@ -10,6 +10,18 @@ import sys
 import logging
 import json
 import time
+import bisect
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import shutil
+import signal
+import tempfile
+import threading
+from collections import deque
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from flask import Flask, request
 from linebot import LineBotApi, WebhookHandler
@@ -213,7 +225,11 @@ CHARACTER_RESPONSES = {
             "ふーん、疲れたんだ。……ちょっとは私のこと頼ってみたら？べ、別に助けたいとかじゃないんだからねっ！",
             "そんな顔して…バカじゃないの。あーもう、しょうがないからお菓子でも買ってきてあげよっか？"
         ],
-        "rare": ["ねぇ、先輩。……私のこと、ちゃんと見てよ。……私、ずっと、あんたのこと……好きだったんだから"]
+        "rare": ["ねぇ、先輩。……私のこと、ちゃんと見てよ。……私、ずっと、あんたのこと……好きだったんだから"],
+        "placeholder": [
+            "…ふーん。先輩の話、ちゃんと聞いてますけど？",
+            "別に…そういうこと言われても、嫌じゃないですけど。"
+        ]
     },
     "kumamoto_mother": {
         "keywords": {
@@ -222,6 +238,10 @@ CHARACTER_RESPONSES = {
         "random": [
             "わたしはいつでも味方ばい。",
             "ちゃんと寝とるとね？あんた、心配ばい。"
+        ],
+        "placeholder": [
+            "うんうん、ちゃんと聞いとるけんね。",
+            "そうね、そうね。あんたの話なら何でも聞くばい。"
         ]
     },
     "poetic_counselor": {
@@ -231,6 +251,10 @@ CHARACTER_RESPONSES = {
         "random": [
             "星が流れる夜は、心も流していいの。",
             "静けさの中に、本当の声があるのよ。"
+        ],
+        "placeholder": [
+            "あなたの言葉、いま静かに胸の奥で響いているわ。",
+            "その想いは、夜空の星のようにちゃんと届いているの。"
         ]
     }
 }
@@ -258,6 +282,280 @@ shiritori_state = {
 
 
 
+# --- 8. ユーザー単位のワーカー振り分け（シャーディング） ---
+# USER_SHARD_WORKERS に 1 以上を設定すると、/callback は署名を検証したイベントを
+# 振り分けプロセスへ送るだけになる。振り分けプロセスは gunicorn マスターから1つだけ
+# 起動され（gunicorn.conf.py の on_starting）、シャード（ワーカープロセス）を1組だけ持つ。
+# source.userId のコンシステントハッシュで担当シャードが決まるので、どの gunicorn
+# ワーカーに届いても同じユーザーは同じプロセスで処理され、user_character_map や
+# しりとり状態がバラバラにならない。
+# シャード内ではユーザーごとに届いた順で処理し、別ユーザーは SHARD_THREADS 本まで並行に動く。
+# GPT待ち（最大 GPT_REPLY_BUDGET_SEC 秒）で詰まるのはそのユーザーのイベントだけだが、
+# 同じシャードで同時に待つユーザーが SHARD_THREADS を超えると、残りはスレッドが空くまで待つ。
+# 振り分けプロセスが落ちたらマスターの監視スレッドが作り直し、親を失ったシャードは自分で終了する。
+USER_SHARD_WORKERS = int(os.getenv("USER_SHARD_WORKERS", "0"))
+SHARD_THREADS = int(os.getenv("SHARD_THREADS", "8"))
+SHARD_RING_REPLICAS = 100  # 1ワーカーあたりの仮想ノード数
+SHARD_MONITOR_INTERVAL_SEC = 5
+SHARD_DISPATCHER_READY_TIMEOUT_SEC = 30
+
+# スレッドが動いているプロセスから fork すると子がロックを握ったまま固まることがあるので、
+# 振り分けプロセスとシャードは spawn で起動する（子は app を import し直すだけで fork 前の状態に頼らない）
+shard_mp = multiprocessing.get_context("spawn")
+
+# 振り分けプロセスの中だけで使う
+shard_queues = []    # シャードごとの multiprocessing.Queue
+shard_processes = []
+shard_lock = threading.Lock()
+
+# gunicorn マスター / ワーカー側で使う
+dispatcher_process = None
+dispatcher_stopping = threading.Event()
+dispatcher_conn = None
+dispatcher_conn_lock = threading.Lock()
+
+def _shard_hash(key: str) -> int:
+    """プロセスをまたいでも同じ値になるハッシュ（組み込み hash() は起動ごとに変わる）"""
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+def build_shard_ring(worker_count, replicas=SHARD_RING_REPLICAS):
+    """ワーカー数からハッシュリングを作る（台数が変わっても移動するユーザーは最小限）"""
+    ring = []
+    for index in range(worker_count):
+        for replica in range(replicas):
+            ring.append((_shard_hash(f"shard-{index}#{replica}"), index))
+    ring.sort()
+    return ring
+
+def pick_shard(ring, user_id: str) -> int:
+    """ユーザーIDを担当するワーカー番号を返す"""
+    if not ring:
+        return 0
+    pos = bisect.bisect(ring, (_shard_hash(user_id or ""), -1))
+    if pos == len(ring):
+        pos = 0
+    return ring[pos][1]
+
+def _event_shard_key(event) -> str:
+    """振り分けキー（user_id が無いイベントはグループ/ルームIDで代用）"""
+    source = getattr(event, "source", None)
+    return (
+        getattr(source, "user_id", None)
+        or getattr(source, "group_id", None)
+        or getattr(source, "room_id", None)
+        or ""
+    )
+
+def _handle_shard_event(event):
+    """@handler.add(MessageEvent, message=TextMessage) と同じ振り分けで処理する"""
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+
+def _shard_worker_loop(shard_index, queue, parent_pid, counters):
+    """シャード本体：担当ユーザーのイベントを、ユーザーごとに届いた順で処理する"""
+    global reply_path_counters
+    reply_path_counters = counters  # spawn で作り直された分を、マスターの共有カウンタに差し替える
+    print(f"🧵 シャードワーカー {shard_index} 起動 (pid={os.getpid()})", flush=True)
+    executor = ThreadPoolExecutor(max_workers=SHARD_THREADS)
+    pending = {}  # { ユーザーキー: deque([イベント, ...]) }
+    pending_lock = threading.Lock()
+
+    def drain(key):
+        while True:
+            with pending_lock:
+                if not pending[key]:
+                    del pending[key]
+                    return
+                event = pending[key].popleft()
+            try:
+                _handle_shard_event(event)
+            except Exception as e:
+                print(f"💥 シャードワーカー {shard_index} エラー:", e, flush=True)
+                print(traceback.format_exc(), flush=True)
+
+    while True:
+        try:
+            event = queue.get(timeout=SHARD_MONITOR_INTERVAL_SEC)
+        except Empty:
+            # 振り分けプロセスが落ちたら、孤児として残らずに終了する
+            if os.getppid() != parent_pid:
+                print(f"⚠️ シャードワーカー {shard_index}: 振り分けプロセスが居なくなったので終了", flush=True)
+                break
+            continue
+        if event is None:
+            break
+        key = _event_shard_key(event)
+        with pending_lock:
+            if key in pending:
+                # 同じユーザーの処理中 → 後ろに並べるだけ（drain が順番に拾う）
+                pending[key].append(event)
+                continue
+            pending[key] = deque([event])
+        executor.submit(drain, key)
+    executor.shutdown(wait=True)
+
+def _start_shard_worker(index):
+    """シャードを新しいキューで起動する（shard_lock を持って呼ぶ）"""
+    shard_queues[index] = shard_mp.Queue()
+    process = shard_mp.Process(
+        target=_shard_worker_loop,
+        args=(index, shard_queues[index], os.getpid(), reply_path_counters),
+        daemon=True,
+    )
+    process.start()
+    shard_processes[index] = process
+
+def _restart_shard_if_dead(index):
+    """落ちたシャードを作り直す（shard_lock を持って呼ぶ）"""
+    process = shard_processes[index]
+    if process.is_alive():
+        return
+    print(
+        f"⚠️ シャードワーカー {index} 停止を検出 (pid={process.pid}, exitcode={process.exitcode}) → 新しいキューで再起動。"
+        "担当ユーザーのキャラ設定・しりとり状態と、キューに残っていた未処理イベントは失われます",
+        flush=True,
+    )
+    # 落ちたプロセスがロックやパイプを握ったままかもしれないので、古いキューは使い回さない
+    old_queue = shard_queues[index]
+    old_queue.cancel_join_thread()
+    old_queue.close()
+    _start_shard_worker(index)
+
+def _watch_shard_workers(parent_pid):
+    """次のイベントを待たずに、落ちたシャードを定期的に作り直す"""
+    while True:
+        time.sleep(SHARD_MONITOR_INTERVAL_SEC)
+        if os.getppid() != parent_pid:
+            # gunicorn マスターが居なくなった → シャードも getppid で気づいて終了する
+            print("⚠️ 振り分けプロセス: gunicorn マスターが居なくなったので終了", flush=True)
+            os._exit(1)
+        with shard_lock:
+            for index in range(len(shard_processes)):
+                _restart_shard_if_dead(index)
+
+def _serve_dispatcher_conn(conn, ring):
+    """gunicorn ワーカー1つからの接続を受け持ち、届いたイベントを担当シャードへ積む"""
+    with conn:
+        while True:
+            try:
+                events = conn.recv()
+            except (EOFError, OSError):
+                return
+            with shard_lock:
+                for event in events:
+                    index = pick_shard(ring, _event_shard_key(event))
+                    _restart_shard_if_dead(index)
+                    shard_queues[index].put(event)
+
+def _run_shard_dispatcher(worker_count, address, authkey, parent_pid, ready, counters):
+    """振り分けプロセス本体：シャードを1組だけ持ち、gunicorn ワーカーからのイベントを振り分ける"""
+    global reply_path_counters
+    reply_path_counters = counters  # シャードへそのまま渡す
+    # terminate() で止められたときも、atexit でシャード（daemon）を道連れにする
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # 先にソケットを開いておく（シャード起動中に来た接続はバックログで待たせる）
+    if os.path.exists(address):
+        os.remove(address)  # 前の振り分けプロセスが残したもの（インスタンス専用ディレクトリ内）
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+
+    ring = build_shard_ring(worker_count)
+    with shard_lock:
+        shard_queues.extend([None] * worker_count)
+        shard_processes.extend([None] * worker_count)
+        for index in range(worker_count):
+            _start_shard_worker(index)
+    threading.Thread(target=_watch_shard_workers, args=(parent_pid,), daemon=True).start()
+
+    print(f"🔀 振り分けプロセス起動 (pid={os.getpid()}, shards={worker_count}, address={address})", flush=True)
+    ready.set()
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, AuthenticationError) as e:
+            print("💥 振り分けプロセス 接続エラー:", e, flush=True)
+            continue
+        threading.Thread(target=_serve_dispatcher_conn, args=(conn, ring), daemon=True).start()
+
+def _dispatcher_exited(process):
+    """振り分けプロセスが終了したか（gunicorn が waitpid(-1) で先に回収しても分かるよう sentinel で見る）"""
+    return bool(multiprocessing.connection.wait([process.sentinel], timeout=0))
+
+def _launch_shard_dispatcher():
+    """振り分けプロセスを起動し、ソケットが開くまで待つ"""
+    global dispatcher_process
+    ready = shard_mp.Event()
+    dispatcher_process = shard_mp.Process(
+        target=_run_shard_dispatcher,
+        args=(
+            USER_SHARD_WORKERS,
+            os.environ["SHARD_DISPATCHER_ADDRESS"],
+            os.environ["SHARD_DISPATCHER_AUTHKEY"].encode("utf-8"),
+            os.getpid(),
+            ready,
+            reply_path_counters,
+        ),
+    )
+    dispatcher_process.start()
+    if not ready.wait(SHARD_DISPATCHER_READY_TIMEOUT_SEC):
+        print("💥 振り分けプロセスの起動待ちがタイムアウトしました", flush=True)
+
+def _supervise_shard_dispatcher():
+    """マスター側の監視スレッド：振り分けプロセスが落ちたら作り直す"""
+    while not dispatcher_stopping.is_set():
+        multiprocessing.connection.wait([dispatcher_process.sentinel])
+        if dispatcher_stopping.is_set():
+            return
+        print(
+            f"⚠️ 振り分けプロセス停止を検出 (pid={dispatcher_process.pid}, exitcode={dispatcher_process.exitcode}) → 再起動。"
+            "全ユーザーのキャラ設定・しりとり状態と、未処理イベントは失われます",
+            flush=True,
+        )
+        time.sleep(1)  # 起動直後に落ち続ける場合の空回り防止
+        _launch_shard_dispatcher()
+
+def start_shard_dispatcher():
+    """振り分けプロセスを起動する（gunicorn マスターの on_starting から1回だけ呼ぶ）"""
+    if USER_SHARD_WORKERS <= 0:
+        return
+    # fork された gunicorn ワーカーは環境変数ごとソケットの場所と認証キーを引き継ぐ
+    # （ソケットはインスタンスごとの一時ディレクトリに置き、同じホストの別インスタンスと衝突させない）
+    os.environ["SHARD_DISPATCHER_ADDRESS"] = os.path.join(
+        tempfile.mkdtemp(prefix="line-select-bot-"), "dispatcher.sock"
+    )
+    os.environ["SHARD_DISPATCHER_AUTHKEY"] = os.urandom(32).hex()
+    _launch_shard_dispatcher()
+    threading.Thread(target=_supervise_shard_dispatcher, daemon=True).start()
+
+def stop_shard_dispatcher():
+    """振り分けプロセスを止める（gunicorn マスターの on_exit から呼ぶ）"""
+    dispatcher_stopping.set()
+    if dispatcher_process is None:
+        return
+    if not _dispatcher_exited(dispatcher_process):
+        dispatcher_process.terminate()
+        multiprocessing.connection.wait([dispatcher_process.sentinel], timeout=10)
+    shutil.rmtree(os.path.dirname(os.environ["SHARD_DISPATCHER_ADDRESS"]), ignore_errors=True)
+
+def send_to_dispatcher(events):
+    """署名検証済みのイベントを振り分けプロセスへ送る（切れていたら1回だけ繋ぎ直す）"""
+    global dispatcher_conn
+    address = os.getenv("SHARD_DISPATCHER_ADDRESS")
+    authkey = os.getenv("SHARD_DISPATCHER_AUTHKEY")
+    if not address or not authkey:
+        raise RuntimeError("振り分けプロセスが起動していません（gunicorn -c gunicorn.conf.py で起動してください）")
+    with dispatcher_conn_lock:
+        for attempt in range(2):
+            try:
+                if dispatcher_conn is None:
+                    dispatcher_conn = Client(address, family="AF_UNIX", authkey=authkey.encode("utf-8"))
+                dispatcher_conn.send(events)
+                return
+            except (OSError, EOFError):
+                dispatcher_conn = None
+                if attempt:
+                    raise
+
+
 # --- 7. LINEのWebhook処理 ---
 @app.route("/callback", methods=['POST'])
 def callback():
@@ -287,7 +585,14 @@ def callback():
         return "Missing Signature", 400
 
     try:
-        handler.handle(body, signature)
+        if USER_SHARD_WORKERS > 0:
+            # parse() は署名が不正なら InvalidSignatureError を投げる
+            events = handler.parser.parse(body, signature)
+            for ev in events:
+                ev.received_at = now  # 締め切り計算用（シャードのキュー待ちも予算に含める）
+            send_to_dispatcher(events)
+        else:
+            handler.handle(body, signature)
     except Exception as e:
         print("💥 Webhook handler エラー:", e, flush=True)
         print("💥 詳細:", traceback.format_exc(), flush=True)
@@ -299,6 +604,10 @@ def callback():
 def index():
     return "LINE BOT is running!"
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    return reply_path_snapshot()
+
 
 
 @handler.add(MessageEvent, message=TextMessage)
@@ -345,44 +654,145 @@ def handle_message(event):
 
 #通常メッセージの処理
     print("💬 通常メッセージ処理開始", flush=True)
-    reply_text = handle_user_message(user_id, user_message)
+    # 返信トークンが切れる前に返せるよう、イベント発生時刻から締め切りを決める
+    # （LINE側の時計が進んでいても、受信時刻より後ろにはしない）
+    received_at = getattr(event, "received_at", None) or time.time()
+    started_at = min(event.timestamp / 1000, received_at)
+    deadline = started_at + GPT_REPLY_BUDGET_SEC
+    reply_text, late_reply = handle_user_message(user_id, user_message, deadline)
     print(f"✅ GPT応答: {reply_text}", flush=True)
 
-    # ✅ ここで必ず返信
-    line_bot_api.reply_message(
-        event.reply_token,
-        TextSendMessage(text=reply_text)
-    )
+    try:
+        # ✅ ここで必ず返信
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=reply_text)
+        )
+    finally:
+        # 仮返信を送ってから本当の応答をプッシュする（順番が逆にならないように）
+        if late_reply is not None:
+            push_to = push_target(event.source)
+            late_reply.add_done_callback(lambda f: push_gpt_reply(push_to, character, started_at, f))
 
 # --- 5. GPT応答処理 ---
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# GPT応答を待つ上限（秒、イベント発生時刻から数える）。超えたら仮の返信をしてあとでプッシュする
+GPT_REPLY_BUDGET_SEC = float(os.getenv("GPT_REPLY_BUDGET_SEC", "8"))
+# 仮返信のあともGPT呼び出しはスロットを使い続けるので、SDK既定（600秒・2回リトライ）ではなく短く切る
+GPT_REQUEST_TIMEOUT_SEC = float(os.getenv("GPT_REQUEST_TIMEOUT_SEC", "20"))
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "1"))
+# イベント発生からこれ以上たった応答は、今さら送っても会話が噛み合わないので捨てる
+GPT_LATE_REPLY_MAX_AGE_SEC = float(os.getenv("GPT_LATE_REPLY_MAX_AGE_SEC", "60"))
+gpt_client = client.with_options(timeout=GPT_REQUEST_TIMEOUT_SEC, max_retries=GPT_MAX_RETRIES)
+# シャード内の同時処理数に加え、仮返信後に走り続ける呼び出しの分も空けておく
+gpt_executor = ThreadPoolExecutor(max_workers=int(os.getenv("GPT_MAX_WORKERS", str(SHARD_THREADS * 2))))
+
+# 返信経路ごとの回数
+# direct: そのまま返信 / placeholder: 仮返信 / push: あとから送信 / push_fallback: GPT失敗時の代わりの一言
+# push_failed: LINEへのプッシュ失敗 / gpt_failed: GPT自体の失敗 / stale_dropped: 古すぎて捨てた応答
+# 共有メモリに置くので、gunicorn ワーカー・シャードすべての合計になる（GET /stats で見られる）
+REPLY_PATHS = ("direct", "placeholder", "push", "push_fallback", "push_failed", "gpt_failed", "stale_dropped")
+reply_path_counters = shard_mp.Array("q", len(REPLY_PATHS))
+
+def reply_path_snapshot():
+    with reply_path_counters.get_lock():
+        return dict(zip(REPLY_PATHS, reply_path_counters[:]))
+
+def count_reply_path(path):
+    with reply_path_counters.get_lock():
+        reply_path_counters[REPLY_PATHS.index(path)] += 1
+        snapshot = dict(zip(REPLY_PATHS, reply_path_counters[:]))
+    print(f"📊 返信経路: {path} → {snapshot}", flush=True)
+
+GPT_ERROR_REPLY = "…エラーが出たみたいですけど？"
+
+def request_gpt(system_prompt, user_message):
+    """GPTに問い合わせる（失敗したら例外のまま返す）"""
+    print("🧠 GPT呼び出し直前:", user_message)
+    response = gpt_client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ],
+        max_tokens=100,
+        temperature=0.8
+    )
+    return response.choices[0].message.content.strip()
+
 def chat_with_gpt(system_prompt, user_message):
     try:
-        print("🧠 GPT呼び出し直前:", user_message)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=100,
-            temperature=0.8
+        return request_gpt(system_prompt, user_message)
+    except Exception as e:
+        print("💥 GPTエラー:", e, flush=True)
+        print("💥 GPTエラー詳細:", traceback.format_exc(), flush=True)
+        return GPT_ERROR_REPLY
+
+def push_target(source):
+    """プッシュ先（返信トークンと同じく、グループ/ルームならそちらへ）"""
+    return (
+        getattr(source, "group_id", None)
+        or getattr(source, "room_id", None)
+        or source.user_id
+    )
+
+def push_gpt_reply(to, character, started_at, future):
+    """締め切りに間に合わなかったGPT応答をプッシュで届ける"""
+    age = time.time() - started_at
+    if age > GPT_LATE_REPLY_MAX_AGE_SEC:
+        print(f"🗑️ GPT応答が古すぎるので送らない（{age:.1f}秒経過）", flush=True)
+        count_reply_path("stale_dropped")
+        return
+    error = future.exception()
+    if error is not None:
+        # GPTが失敗しても黙らず、キャラの一言で締める
+        print("💥 GPTエラー（仮返信後）:", error, flush=True)
+        count_reply_path("gpt_failed")
+        reply_text, path = random.choice(CHARACTER_RESPONSES[character]["random"]), "push_fallback"
+    else:
+        reply_text, path = future.result(), "push"
+    try:
+        print(f"📮 GPT応答をプッシュ送信: {reply_text}", flush=True)
+        line_bot_api.push_message(to, TextSendMessage(text=reply_text))
+        count_reply_path(path)
+    except Exception as e:
+        print("💥 プッシュ送信エラー:", e, flush=True)
+        print(traceback.format_exc(), flush=True)
+        count_reply_path("push_failed")
+
+def chat_with_gpt_by_deadline(character, system_prompt, user_message, deadline):
+    """締め切りまでGPT応答を待つ。間に合わなければ (キャラの仮返信, 応答待ちの future) を返す"""
+    future = gpt_executor.submit(request_gpt, system_prompt, user_message)
+    remaining = deadline - time.time()
+    try:
+        reply_text = future.result(timeout=max(0, remaining))
+    except FutureTimeoutError:
+        print(
+            f"⏰ GPT応答が締め切りに間に合わず（残り予算 {remaining:.2f}秒 / 上限 {GPT_REPLY_BUDGET_SEC}秒）"
+            " → 仮返信してあとでプッシュ",
+            flush=True,
         )
-        return response.choices[0].message.content.strip()
+        count_reply_path("placeholder")
+        responses = CHARACTER_RESPONSES[character]
+        return random.choice(responses.get("placeholder") or responses["random"]), future
     except Exception as e:
         print("💥 GPTエラー:", e, flush=True)
         print("💥 GPTエラー詳細:", traceback.format_exc(), flush=True)
-        return "…エラーが出たみたいですけど？"
+        count_reply_path("gpt_failed")
+        return GPT_ERROR_REPLY, None
+    count_reply_path("direct")
+    return reply_text, None
 
 # --- 6. メッセージ処理本体 ---
-def handle_user_message(user_id, user_message):
+def handle_user_message(user_id, user_message, deadline=None):
+    """返信文と、締め切りに間に合わなかったGPT応答の future（なければ None）を返す"""
     print(f"📩 {user_id} さんから: {user_message}", flush=True)
 
 # コマンド切り替え
     character_change_msg = update_character(user_id, user_message)
     if character_change_msg:
-        return character_change_msg
+        return character_change_msg, None
 
 
 # キャラ設定されてない場合はデフォルト（ツンデレ）
@@ -393,22 +803,24 @@ def handle_user_message(user_id, user_message):
     for keyword, responses in CHARACTER_RESPONSES[character]["keywords"].items():
         if keyword in user_message:
             print("✨ キーワードヒット:", keyword, flush=True)
-            return random.choice(responses)
+            return random.choice(responses), None
 
 # 3%の確率で特別なレア返答
     if random.random() < 0.03:
         print("🌟 超レア返答発動！", flush=True)
-        return random.choice(CHARACTER_RESPONSES[character]["rare"])
+        return random.choice(CHARACTER_RESPONSES[character]["rare"]), None
     
 # ランダム応答（30%くらいの確率で）
     if random.random() < 0.3:
         print("🎲 ランダム応答発動！", flush=True)
-        return random.choice(CHARACTER_RESPONSES[character]["random"])
+        return random.choice(CHARACTER_RESPONSES[character]["random"]), None
     
 # GPT応答
     print("🧠 GPTに送信", flush=True)
     system_prompt = CHARACTER_PROMPTS[character]
-    return chat_with_gpt(system_prompt, user_message)
+    if deadline is None:
+        return chat_with_gpt(system_prompt, user_message), None
+    return chat_with_gpt_by_deadline(character, system_prompt, user_message, deadline)
 
 
 def get_shiritori_word(last_char, character):
@@ -0,0 +1,20 @@
+"""
+gunicorn の設定。
+
+USER_SHARD_WORKERS に 1 以上を設定したときは、マスターで振り分けプロセスを1つだけ起動し、
+全 gunicorn ワーカーがそこへイベントを送る（ユーザーごとの状態を1プロセスに集めるため）。
+振り分けプロセスが落ちたときはマスターの監視スレッドが作り直す（それまでの状態は失われる）。
+ワーカー数は WEB_CONCURRENCY（または -w）で指定する。
+
+    USER_SHARD_WORKERS=2 WEB_CONCURRENCY=2 gunicorn -c gunicorn.conf.py app:app
+"""
+
+
+def on_starting(server):
+    import app
+    app.start_shard_dispatcher()
+
+
+def on_exit(server):
+    import app
+    app.stop_shard_dispatcher()